@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Ownership Analysis Benchmark
+
+Generates a synthetic git repository of configurable size and times each
+phase of analyze-repo-file-ownership.py against it, so that performance
+changes to the analyzer can be compared without a real checkout.
+
+Usage:
+    python3 repo-health/benchmark-repo-file-ownership.py \\
+        [--files N] [--depth N] [--authors N] [--commits N] [--lines N] \\
+        [--engine blame|history ...] [--repeat N] [--output results.json]
+
+Each engine is run with a cold cache and then again with a warm cache (the
+history engine doesn't use the blame cache, so it is only run once per
+repetition). Results, including the per-phase timings recorded by
+OwnershipAnalyzer.run, are printed as JSON or written to --output.
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import subprocess
+import tempfile
+import importlib.util
+import contextlib
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+ANALYZER_PATH = Path(__file__).resolve().parent / "analyze-repo-file-ownership.py"
+SECONDS_PER_YEAR = 365.25 * 24 * 60 * 60
+HISTORY_YEARS = 5  # Synthetic commits are spread over this many years
+
+
+@dataclass
+class SyntheticRepoConfig:
+    """Shape of the generated repository."""
+
+    files: int = 500
+    depth: int = 4
+    authors: int = 20
+    commits: int = 200
+    lines: int = 200
+    files_per_commit: int = 10
+    lines_per_change: int = 10
+    owners_every: int = 5  # Add an OWNERS file to every Nth directory
+    seed: int = 0
+
+
+def load_analyzer():
+    """Import analyze-repo-file-ownership.py as a module.
+
+    The module is registered in sys.modules so its worker functions can be
+    pickled by the multiprocessing pool.
+    """
+    spec = importlib.util.spec_from_file_location("ownership_analyzer", ANALYZER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _fast_import_data(payload: str) -> str:
+    encoded = payload.encode("utf-8")
+    return f"data {len(encoded)}\n{payload}\n"
+
+
+def generate_repo(repo_path: Path, config: SyntheticRepoConfig):
+    """Create a synthetic repository using git fast-import.
+
+    The first commit adds every file; each later commit has a random author
+    rewrite a few lines in a few files, with author times spread evenly over
+    the last HISTORY_YEARS years.
+    """
+    rng = random.Random(config.seed)
+
+    directories = [""]
+    for _ in range(max(1, config.files // 10)):
+        parent = rng.choice(directories)
+        if parent.count("/") + 1 >= config.depth:
+            continue
+        name = f"dir{len(directories)}"
+        directories.append(f"{parent}/{name}" if parent else name)
+
+    files: Dict[str, List[str]] = {}
+    for i in range(config.files):
+        directory = rng.choice(directories)
+        path = f"{directory}/file{i}.go" if directory else f"file{i}.go"
+        files[path] = [f"// {path} line {n}" for n in range(config.lines)]
+
+    owners_files = {
+        (f"{directory}/OWNERS" if directory else "OWNERS"): (
+            f"approvers:\n- approver{i}\nreviewers:\n- reviewer{i}\n"
+        )
+        for i, directory in enumerate(directories)
+        if i % config.owners_every == 0
+    }
+
+    authors = [(f"Author {i}", f"author{i}@example.com") for i in range(config.authors)]
+    now = int(datetime.now(timezone.utc).timestamp())
+    start = now - int(HISTORY_YEARS * SECONDS_PER_YEAR)
+    step = (now - start) // max(1, config.commits)
+
+    subprocess.run(["git", "init", "-q", "-b", "main", str(repo_path)], check=True)
+    proc = subprocess.Popen(
+        ["git", "fast-import", "--quiet"],
+        cwd=repo_path,
+        stdin=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+    )
+
+    def write_commit(number: int, author, changed: Dict[str, str]):
+        name, email = author
+        timestamp = start + number * step
+        proc.stdin.write("commit refs/heads/main\n")
+        proc.stdin.write(f"author {name} <{email}> {timestamp} +0000\n")
+        proc.stdin.write(f"committer {name} <{email}> {timestamp} +0000\n")
+        proc.stdin.write(_fast_import_data(f"Synthetic commit {number}"))
+        for path, content in changed.items():
+            proc.stdin.write(f"M 100644 inline {path}\n")
+            proc.stdin.write(_fast_import_data(content))
+        proc.stdin.write("\n")
+
+    initial = {path: "\n".join(lines) + "\n" for path, lines in files.items()}
+    initial.update(owners_files)
+    write_commit(0, authors[0], initial)
+
+    paths = list(files)
+    for number in range(1, config.commits):
+        changed = {}
+        for path in rng.sample(paths, min(config.files_per_commit, len(paths))):
+            lines = files[path]
+            for _ in range(config.lines_per_change):
+                lines[rng.randrange(len(lines))] = (
+                    f"// {path} changed in commit {number} {rng.random()}"
+                )
+            changed[path] = "\n".join(lines) + "\n"
+        write_commit(number, rng.choice(authors), changed)
+
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError("git fast-import failed")
+
+    subprocess.run(["git", "checkout", "-q", "main"], cwd=repo_path, check=True)
+    subprocess.run(["git", "reset", "-q", "--hard"], cwd=repo_path, check=True)
+
+
+def run_analysis(module, repo_path: Path, engine: str, workers: int) -> dict:
+    """Run one analysis with its console output suppressed and time it."""
+    analyzer = module.OwnershipAnalyzer(str(repo_path), engine=engine, workers=workers)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+        devnull
+    ), contextlib.redirect_stderr(devnull):
+        analyzer.run()
+
+    return {
+        "phases": {k: round(v, 4) for k, v in analyzer.phase_timings.items()},
+        "total": round(sum(analyzer.phase_timings.values()), 4),
+        "files": len(analyzer.file_blobs),
+        "directories": len(analyzer.directory_stats),
+    }
+
+
+def clear_cache(module, repo_path: Path):
+    """Remove the analyzer's blame cache so the next run starts cold."""
+    cache_file = repo_path / ".git" / module.CACHE_FILENAME
+    if cache_file.exists():
+        cache_file.unlink()
+
+
+def main():
+    """Main entry point."""
+    defaults = SyntheticRepoConfig()
+    parser = argparse.ArgumentParser(
+        description="Benchmark analyze-repo-file-ownership.py on a synthetic repo."
+    )
+    parser.add_argument("--files", type=int, default=defaults.files)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--authors", type=int, default=defaults.authors)
+    parser.add_argument("--commits", type=int, default=defaults.commits)
+    parser.add_argument("--lines", type=int, default=defaults.lines)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument(
+        "--engine",
+        dest="engines",
+        action="append",
+        default=[],
+        help="Engine to benchmark; repeatable (default: blame and history)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--keep-repo",
+        help="Generate (or reuse) the synthetic repository at this path",
+    )
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    config = SyntheticRepoConfig(
+        files=args.files,
+        depth=args.depth,
+        authors=args.authors,
+        commits=args.commits,
+        lines=args.lines,
+        seed=args.seed,
+    )
+    module = load_analyzer()
+    engines = args.engines or list(module.ENGINES)
+
+    with tempfile.TemporaryDirectory(prefix="ownership-bench-") as tmpdir:
+        repo_path = Path(args.keep_repo or Path(tmpdir) / "repo").resolve()
+        if not (repo_path / ".git").exists():
+            print(f"Generating synthetic repository in {repo_path}...", file=sys.stderr)
+            generate_repo(repo_path, config)
+
+        runs = []
+        for repetition in range(args.repeat):
+            for engine in engines:
+                clear_cache(module, repo_path)
+                cache_states = (
+                    ["cold", "warm"] if engine == module.ENGINE_BLAME else ["n/a"]
+                )
+                for cache_state in cache_states:
+                    print(
+                        f"Run {repetition + 1}/{args.repeat}: {engine} ({cache_state} cache)",
+                        file=sys.stderr,
+                    )
+                    result = run_analysis(module, repo_path, engine, args.workers)
+                    result.update(
+                        {
+                            "engine": engine,
+                            "cache": cache_state,
+                            "repetition": repetition,
+                        }
+                    )
+                    runs.append(result)
+
+    results = {
+        "benchmark_date": datetime.now().isoformat(),
+        "config": asdict(config),
+        "workers": args.workers,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git": subprocess.run(
+                ["git", "--version"], capture_output=True, text=True
+            ).stdout.strip(),
+            "numpy": module.np is not None,
+        },
+        "runs": runs,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
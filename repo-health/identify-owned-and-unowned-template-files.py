@@ -1,12 +1,36 @@
 #!/usr/bin/env python3
 
+from array import array
 from dataclasses import dataclass
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
 
+import argparse
+import csv
 import datetime
+import hashlib
+import json
 import os
+import sys
+import sqlite3
 import subprocess
 
+# Number of files blamed concurrently.
+MAX_WORKERS = os.cpu_count() or 1
+
+# Blame results are cached in this file inside the .git directory, keyed by
+# each file's path and blob SHA so that a changed file is always re-blamed.
+# Files with uncommitted changes are never cached, since their blame (which
+# includes "Not Committed Yet" lines) doesn't match the blob SHA in the index.
+BLAME_CACHE_FILENAME = "template-blame-cache.sqlite"
+
+MAIL_KEYS = ["author-mail", "committer-mail"]
+
+# Directories that are never walked: git's own, and vendored dependencies,
+# which aren't covered by the repository's OWNERS files anyway.
+SKIP_DIRS = {".git", "vendor"}
+
 
 # Represents an individual template file in the MCO repository.
 @dataclass
@@ -16,21 +40,11 @@ class TemplateFile:
     contributors: list
 
     @classmethod
-    def FromFilename(cls, filename, is_owned):
-        cmd = subprocess.run(
-            ["git", "blame", "-p", "--show-email", filename],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-
-        emails = defaultdict(int)
-
-        mail_keys = ["author-mail", "committer-mail"]
-
-        for record in parse_git_blame_data(cmd.stdout.splitlines()):
-            for key in mail_keys:
-                emails[record[key]] += 1
+    def FromFilename(cls, filename, is_owned, emails=None):
+        # Blame the file unless its email counts were already computed (e.g.
+        # by blame_files()).
+        if emails is None:
+            emails = blame_emails(filename)
 
         # Convert into a tuple so that the number of emails can be counted and
         # sorted in descending order.
@@ -43,116 +57,574 @@ class TemplateFile:
         return TemplateFile(filename=filename, is_owned=is_owned, contributors=emails)
 
 
-# Generated by Google Gemini
+# Runs git blame on a single file and returns how many lines each author and
+# committer email is responsible for. The porcelain output is parsed as it is
+# streamed rather than being collected first.
+def blame_emails(filename, repo=None):
+    cmd = ["git", "blame", "-p", "--show-email", filename]
+    proc = subprocess.Popen(
+        cmd, cwd=repo, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    emails = count_blame_emails(proc.stdout)
+    proc.stdout.close()
+
+    if proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+    return emails
+
+
+# Pool task wrapper around blame_emails. Returns None for files that can't be
+# blamed (e.g. untracked files) rather than failing the whole run.
+def blame_task(args):
+    filename, repo = args
+    try:
+        return blame_emails(filename, repo)
+    except subprocess.CalledProcessError:
+        return None
+
+
+# Counts author and committer emails in git blame porcelain output, using the
+# per-line commit indexes from parse_git_blame_data rather than per-line
+# records.
+def count_blame_emails(lines):
+    return parse_git_blame_data(lines).count_emails()
+
+
+# Persistent cache of blame email counts, shared by every run against the same
+# repository. Blame applies .mailmap to the emails it reports, so the cache is
+# cleared whenever the repository's .mailmap changes.
+class BlameCache:
+    def __init__(self, db_path, mailmap_digest=""):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS blame ("
+            "path TEXT NOT NULL, blob TEXT NOT NULL, emails TEXT NOT NULL, "
+            "PRIMARY KEY (path, blob))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'mailmap_digest'"
+        ).fetchone()
+        if row is None or row[0] != mailmap_digest:
+            self.conn.execute("DELETE FROM blame")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) "
+                "VALUES ('mailmap_digest', ?)",
+                (mailmap_digest,),
+            )
+        self.conn.commit()
+
+    @classmethod
+    def Open(cls, repo=None):
+        # Returns None when not within a git repository.
+        cmd = subprocess.run(
+            ["git", "rev-parse", "--git-common-dir", "--show-toplevel"],
+            cwd=repo,
+            capture_output=True,
+            text=True,
+        )
+        if cmd.returncode != 0:
+            return None
+
+        common_dir, toplevel = cmd.stdout.splitlines()[:2]
+        git_dir = os.path.join(repo or ".", common_dir)
+
+        digest = hashlib.sha256()
+        try:
+            with open(os.path.join(toplevel, ".mailmap"), "rb") as mailmap:
+                digest.update(mailmap.read())
+        except OSError:
+            pass
+
+        return cls(os.path.join(git_dir, BLAME_CACHE_FILENAME), digest.hexdigest())
+
+    def get(self, path, blob):
+        row = self.conn.execute(
+            "SELECT emails FROM blame WHERE path = ? AND blob = ?", (path, blob)
+        ).fetchone()
+        if row is None:
+            return None
+
+        # Stored as [email, count] pairs since an email may be missing (None).
+        return defaultdict(int, {email: count for email, count in json.loads(row[0])})
+
+    def put_many(self, entries):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO blame (path, blob, emails) VALUES (?, ?, ?)",
+            [
+                (path, blob, json.dumps(list(emails.items())))
+                for (path, blob), emails in entries.items()
+            ],
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# Maps each tracked file under root to its blob SHA, keyed by its path
+# relative to repo (or the current directory). Only root is passed to
+# `git ls-files`, never the individual files, so there is no limit on how many
+# files can be looked up. Returns an empty mapping if the files can't be
+# listed, e.g. when root is outside the repository.
+def git_blobs(root=".", repo=None):
+    cmd = subprocess.run(
+        ["git", "ls-files", "-s", "-z", "--", f":(literal){root}"],
+        cwd=repo,
+        capture_output=True,
+        text=True,
+    )
+    if cmd.returncode != 0:
+        return {}
+
+    blobs = {}
+    for entry in cmd.stdout.split("\0"):
+        if entry:
+            # Format: <mode> <blob> <stage>\t<path>
+            info, path = entry.split("\t", 1)
+            blobs[path] = info.split(" ")[1]
+
+    return blobs
+
+
+# Returns the paths (relative to repo, or the current directory) of files
+# whose working tree contents differ from HEAD, whether staged or not. Returns
+# None if that can't be determined, e.g. before the first commit.
+def uncommitted_files(repo=None):
+    cmd = subprocess.run(
+        ["git", "diff", "--name-only", "--relative", "-z", "HEAD", "--"],
+        cwd=repo,
+        capture_output=True,
+        text=True,
+    )
+    if cmd.returncode != 0:
+        return None
+
+    return set(path for path in cmd.stdout.split("\0") if path)
+
+
+# Size of a file for scheduling purposes. Symlinks aren't followed, since a
+# tracked symlink is blamed as the link itself (and may dangle).
+def file_size(path):
+    try:
+        return os.lstat(path).st_size
+    except OSError:
+        return 0
+
+
+# Blames each of the given files and returns their email counts, keyed by
+# filename.
+def blame_files(filenames, workers=MAX_WORKERS):
+    return blame_files_in_repos({None: list(filenames)}, workers)[None]
+
+
+# Blames files across any number of repositories, given as a mapping of
+# repository path (None for the current directory) to filenames, and returns
+# {repo: {filename: email counts}}. Files that can't be blamed map to None.
+#
+# Each repository's blame cache is checked first, skipping files with
+# uncommitted changes. The remaining files from all repositories then share a
+# single process pool of at most `workers` processes, largest files first so
+# that big files don't hold up the end of the run.
+def blame_files_in_repos(files_by_repo, workers=MAX_WORKERS):
+    results = {repo: {} for repo in files_by_repo}
+    caches = {}
+    keys = {}
+    tasks = []
+
+    for repo, filenames in files_by_repo.items():
+        paths = {
+            filename: os.path.normpath(os.path.relpath(filename, repo or "."))
+            for filename in filenames
+        }
+        cache = BlameCache.Open(repo) if filenames else None
+        caches[repo] = cache
+
+        # List everything under the files' common directory in one go.
+        blobs = {}
+        if cache:
+            blobs = git_blobs(os.path.commonpath(list(paths.values())) or ".", repo)
+
+        uncommitted = uncommitted_files(repo) if cache else set()
+        if uncommitted is None:
+            blobs = {}
+
+        for filename in filenames:
+            path = paths[filename]
+            blob = blobs.get(path)
+            if blob and path not in uncommitted:
+                keys[(repo, filename)] = (path, blob)
+                cached = cache.get(path, blob)
+                if cached is not None:
+                    results[repo][filename] = cached
+                    continue
+
+            tasks.append((filename, repo))
+
+    tasks.sort(key=lambda task: file_size(task[0]), reverse=True)
+    if tasks:
+        with Pool(processes=max(1, min(workers, len(tasks)))) as pool:
+            for (filename, repo), emails in zip(
+                tasks, pool.imap(blame_task, tasks, chunksize=4)
+            ):
+                results[repo][filename] = emails
+
+    for repo, cache in caches.items():
+        if cache:
+            cache.put_many(
+                {
+                    keys[(task_repo, filename)]: results[repo][filename]
+                    for filename, task_repo in tasks
+                    if task_repo == repo
+                    and (repo, filename) in keys
+                    and results[repo][filename] is not None
+                }
+            )
+            cache.close()
+
+    return results
+
+
+# A commit referenced by git blame, with its metadata parsed once no matter
+# how many lines it is responsible for.
+@dataclass
+class BlameCommit:
+    sha: str
+    author: str
+    committer: str
+    author_mail: str
+    committer_mail: str
+    author_time: datetime.datetime
+    committer_time: datetime.datetime
+
+    @classmethod
+    def FromMetadata(cls, sha, metadata):
+        def timestamp(key):
+            value = metadata.get(key)
+            return datetime.datetime.fromtimestamp(int(value)) if value else None
+
+        return BlameCommit(
+            sha=sha,
+            author=metadata.get("author"),
+            committer=metadata.get("committer"),
+            author_mail=metadata.get("author-mail"),
+            committer_mail=metadata.get("committer-mail"),
+            author_time=timestamp("author-time"),
+            committer_time=timestamp("committer-time"),
+        )
+
+    # The per-line record format returned by earlier versions of
+    # parse_git_blame_data.
+    def to_record(self):
+        return {
+            "sha": self.sha,
+            "author": self.author,
+            "committer": self.committer,
+            "author-mail": self.author_mail,
+            "committer-mail": self.committer_mail,
+            "author-time": self.author_time,
+            "committer-time": self.committer_time,
+        }
+
+
+# Columnar git blame results: a deduplicated table of commits, in order of
+# first appearance, and the index into that table of the commit responsible
+# for each line. Aggregations (email counts, recency, ...) work over the
+# indexes instead of per-line records.
+@dataclass
+class BlameData:
+    commits: list
+    line_commits: array
+
+    def __len__(self):
+        return len(self.line_commits)
+
+    # Yields a record dict per line, built on demand, for callers that want
+    # the old per-line format.
+    def __iter__(self):
+        records = [commit.to_record() for commit in self.commits]
+        for index in self.line_commits:
+            yield dict(records[index])
+
+    # Number of lines each commit is responsible for, indexed like commits.
+    def line_counts(self):
+        counts = [0] * len(self.commits)
+        for index in self.line_commits:
+            counts[index] += 1
+        return counts
+
+    # Number of lines per author and committer email. Emails are inserted in
+    # order of first appearance, author before committer.
+    def count_emails(self):
+        emails = defaultdict(int)
+        for commit, count in zip(self.commits, self.line_counts()):
+            emails[commit.author_mail] += count
+            emails[commit.committer_mail] += count
+        return emails
+
+
+# Parses git blame porcelain output (e.g. `git blame -p`) from any iterable of
+# lines, such as a subprocess's stdout, without holding the whole output.
 def parse_git_blame_data(lines):
-    blame_data = []
-    commits = {}  # Cache for commit metadata
-
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        parts = line.split()
-
-        # 1. Parse the Header Line
-        # Format: <sha> <orig_lineno> <final_lineno> <group_lines>
-        sha = parts[0]
-        orig_lineno = parts[1]
-        final_lineno = parts[2]
-
-        # 2. Parse Commit Metadata (if not already cached)
-        if sha not in commits:
-            commits[sha] = {}
-            i += 1
-            while i < len(lines) and not lines[i].startswith("\t"):
-                # Split metadata into key and value (e.g., "author Linus Torvalds")
-                meta_parts = lines[i].split(" ", 1)
-                if len(meta_parts) == 2:
-                    commits[sha][meta_parts[0]] = meta_parts[1]
-                i += 1
+    commits = []
+    commit_indexes = {}
+    line_commits = array("I")
+
+    metadata = None
+    expecting_header = True
+    for line in lines:
+        # The content line ends each entry; the next line is a new header.
+        if line.startswith("\t"):
+            if metadata is not None:
+                commits.append(BlameCommit.FromMetadata(sha, metadata))
+                metadata = None
+            expecting_header = True
+            continue
+
+        # Header format: <sha> <orig_lineno> <final_lineno> [<group_lines>]
+        if expecting_header:
+            sha = line.split(" ", 1)[0]
+            index = commit_indexes.get(sha)
+            if index is None:
+                index = commit_indexes[sha] = len(commit_indexes)
+                metadata = {}
+            line_commits.append(index)
+            expecting_header = False
+            continue
+
+        # Commit metadata, which only follows the first header for each SHA.
+        if metadata is not None:
+            key, _, value = line.rstrip("\n").partition(" ")
+            metadata[key] = value
+
+    if metadata is not None:
+        commits.append(BlameCommit.FromMetadata(sha, metadata))
+
+    return BlameData(commits=commits, line_commits=line_commits)
+
+
+# Walks the directory tree under root once, yielding (path, owners_file) for
+# every file other than OWNERS files themselves. owners_file is the nearest
+# OWNERS file in the file's directory or any of its ancestors below root (or
+# None), carried down the tree as it is walked. Per the specification for
+# OWNERS files, such a file has an owner:
+# https://github.com/kubernetes/community/blob/master/contributors/guide/owners.md
+def walk_with_owners(root, owners_file=None):
+    with os.scandir(root) as it:
+        entries = list(it)
+
+    # An OWNERS file covers its whole directory, so find it before yielding.
+    for entry in entries:
+        if entry.name == "OWNERS" and not entry.is_dir():
+            owners_file = entry.path
+
+    subdirs = []
+    for entry in entries:
+        if entry.is_dir():
+            # Like os.walk, don't follow symlinked directories.
+            if not entry.is_symlink() and entry.name not in SKIP_DIRS:
+                subdirs.append(entry.path)
+        elif entry.name != "OWNERS":
+            yield entry.path, owners_file
+
+    for subdir in subdirs:
+        yield from walk_with_owners(subdir, owners_file)
+
+
+# Only unowned files are blamed unless blame_owned is set; otherwise owned
+# files are returned without contributors.
+def identify_owned_and_unowned_files(
+    root="./templates", workers=MAX_WORKERS, blame_owned=False
+):
+    owned_files = []
+    unowned_files = []
+
+    # Sort each file by whether an OWNERS file covers it in a single walk.
+    for path, owners_file in walk_with_owners(root):
+        if owners_file:
+            owned_files.append(path)
         else:
-            # Skip metadata if we already have it for this SHA
-            while i < len(lines) and not lines[i].startswith("\t"):
-                i += 1
-
-        # 3. Parse the Content Line
-        # The line itself starts with a tab
-        content = lines[i][1:] if i < len(lines) else ""
-
-        keys = [
-            "sha",
-            "author",
-            "committer",
-            "author-mail",
-            "committer-mail",
-        ]
-
-        time_keys = [
-            "author-time",
-            "committer-time",
-        ]
-
-        record = {}
-        for key in keys + time_keys:
-            record[key] = commits[sha].get(key)
-
-        for key in time_keys:
-            if record[key] == "":
-                record[key] = None
-            else:
-                record[key] = datetime.datetime.fromtimestamp(int(record[key]))
-
-        blame_data.append(record)
-
-        i += 1
-
-    return blame_data
-
-
-def identify_owned_and_unowned_files():
-    all_files = set()
-    owners_files = set()
-
-    # First, enumerate all files within the templates directory and identify
-    # any OWNERS files specifically.
-    for root, dirs, files in os.walk("./templates"):
-        for file in files:
-            full_path = os.path.join(root, file)
-            all_files.add(full_path)
-            if file == "OWNERS":
-                owners_files.add(full_path)
-
-    owned_files = set()
-
-    # Next, strip the directory off of each OWNERS file and then walk that
-    # directory structure to identify all files contained within. These files
-    # have an owner according to the specification for OWNERS files here:
-    # https://github.com/kubernetes/community/blob/master/contributors/guide/owners.md
-    for owners_file in owners_files:
-        subdir = os.path.dirname(owners_file)
-        for root, dirs, files in os.walk(subdir):
-            for file in files:
-                full_path = os.path.join(root, file)
-                if full_path not in owners_files:
-                    owned_files.add(os.path.join(root, file))
-
-    # Now we can determine which files are unowned because they are not
-    # included in the set of either all files or the owners files.
-    unowned_files = all_files - owned_files - owners_files
+            unowned_files.append(path)
+
+    # Blame every file at once so that the work is spread across the pool.
+    emails = blame_files((owned_files if blame_owned else []) + unowned_files, workers)
 
     # Load everything into a sorted list as a TemplateFile instance.
     owned_files = sorted(
-        [TemplateFile.FromFilename(filename, True) for filename in owned_files],
+        [
+            TemplateFile.FromFilename(filename, True, emails.get(filename) or {})
+            for filename in owned_files
+        ],
         key=lambda x: x.filename,
     )
 
     unowned_files = sorted(
-        [TemplateFile.FromFilename(filename, False) for filename in unowned_files],
+        [
+            TemplateFile.FromFilename(filename, False, emails[filename] or {})
+            for filename in unowned_files
+        ],
         key=lambda x: x.filename,
     )
 
     return owned_files, unowned_files
 
 
-owned_files, unowned_files = identify_owned_and_unowned_files()
-for file in unowned_files:
-    print(file.filename, "=>", file.contributors)
+# Audits several repository checkouts in one run. The coverage walks run in
+# threads, one per repository, and then the unowned files of every repository
+# are blamed together in a single process pool bounded by `workers`. Returns
+# a summary per repository and a list of gaps (unowned files with their
+# contributors) across all of them.
+def audit_repos(repos, root="./templates", workers=MAX_WORKERS):
+    repos = list(dict.fromkeys(os.path.abspath(repo) for repo in repos))
+
+    def coverage(repo):
+        try:
+            return list(walk_with_owners(os.path.join(repo, root))), None
+        except OSError as e:
+            return [], str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(repos)))) as executor:
+        walks = dict(zip(repos, executor.map(coverage, repos)))
+
+    unowned = {
+        repo: sorted(path for path, owners_file in walk if not owners_file)
+        for repo, (walk, _) in walks.items()
+    }
+    emails = blame_files_in_repos(unowned, workers)
+
+    summaries = []
+    gaps = []
+    for repo in repos:
+        walk, error = walks[repo]
+        summaries.append(
+            {
+                "repo": repo,
+                "owned_files": len(walk) - len(unowned[repo]),
+                "unowned_files": len(unowned[repo]),
+                "error": error,
+            }
+        )
+
+        for filename in unowned[repo]:
+            file = TemplateFile.FromFilename(
+                filename, False, emails[repo][filename] or {}
+            )
+            gaps.append(
+                {
+                    "repo": repo,
+                    "file": os.path.relpath(filename, repo),
+                    "contributors": [
+                        {"email": email, "lines": lines}
+                        for email, lines in file.contributors
+                    ],
+                }
+            )
+
+    return summaries, gaps
+
+
+# Writes the merged gap report from audit_repos() as JSON or CSV. The CSV has
+# one row per unowned file, with every contributor in a single column as
+# email=lines pairs separated by semicolons.
+def write_gap_report(summaries, gaps, output, report_format="json"):
+    if report_format == "json":
+        json.dump(
+            {
+                "generated": datetime.datetime.now().isoformat(),
+                "repos": summaries,
+                "gaps": gaps,
+            },
+            output,
+            indent=2,
+        )
+        output.write("\n")
+        return
+
+    writer = csv.writer(output)
+    writer.writerow(["repo", "file", "top_contributor", "top_lines", "contributors"])
+    for gap in gaps:
+        contributors = gap["contributors"]
+        top = contributors[0] if contributors else {"email": "", "lines": 0}
+        writer.writerow(
+            [
+                gap["repo"],
+                gap["file"],
+                top["email"],
+                top["lines"],
+                ";".join(f"{c['email']}={c['lines']}" for c in contributors),
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="List files not covered by any OWNERS file, with their contributors."
+    )
+    parser.add_argument(
+        "--root",
+        default="./templates",
+        help="Directory to audit, e.g. . for the whole repository (vendor "
+        "directories are skipped); relative to each --repo in batch mode "
+        "(default ./templates)",
+    )
+    parser.add_argument(
+        "--repo",
+        dest="repos",
+        action="append",
+        default=[],
+        help="Repository checkout to audit; repeat to audit several at once and "
+        "write a merged gap report",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["json", "csv"],
+        default="json",
+        help="Format of the merged gap report (default json)",
+    )
+    parser.add_argument(
+        "--output",
+        help="File to write the merged gap report to (default stdout)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help=f"Number of files to blame concurrently (default {MAX_WORKERS})",
+    )
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if args.repos:
+        summaries, gaps = audit_repos(args.repos, args.root, args.workers)
+        for summary in summaries:
+            status = summary["error"] or (
+                f"{summary['unowned_files']} unowned, "
+                f"{summary['owned_files']} owned files"
+            )
+            print(f"{summary['repo']}: {status}", file=sys.stderr)
+
+        if args.output:
+            with open(args.output, "w", newline="") as output:
+                write_gap_report(summaries, gaps, output, args.format)
+        else:
+            write_gap_report(summaries, gaps, sys.stdout, args.format)
+        return
+
+    if not os.path.isdir(args.root):
+        parser.error(f"{args.root} is not a directory")
+
+    owned_files, unowned_files = identify_owned_and_unowned_files(
+        args.root, args.workers
+    )
+    for file in unowned_files:
+        print(file.filename, "=>", file.contributors)
+
+
+if __name__ == "__main__":
+    main()
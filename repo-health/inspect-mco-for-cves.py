@@ -1,13 +1,35 @@
 #!/usr/bin/env python3
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from itertools import groupby
 
+import argparse
+import bisect
 import contextlib
+import csv
 import os
 import json
 import subprocess
+import sys
 import time
 
+DEFAULT_REPO_DIR = "/home/zzlotnik/Scratchspace/claude-mco-workspace"
+
+# Release branches up to and including this minor version are skipped.
+DEFAULT_MIN_MINOR = 10
+
+# Sorts before every real version; OSV uses "0" to mean "from the beginning".
+MIN_VERSION_KEY = (0, 0, 0, (0, ()))
+
+# From this go directive on, go.mod lists every module in the build list
+# (module graph pruning), so go.sum no longer needs to be consulted.
+PRUNED_MODULE_GRAPH_GO_VERSION = (1, 17)
+
+# OSV range types whose events are semantic versions.
+OSV_RANGE_TYPES = {"SEMVER", "ECOSYSTEM"}
+
 
 @dataclass(unsafe_hash=True, order=True)
 class ReleaseBranch:
@@ -28,6 +50,320 @@ class ReleaseBranch:
         return self.branch_name
 
 
+# The parts of a go.mod file needed to know which version of each module a
+# branch builds with.
+@dataclass
+class GoMod:
+    module: str = ""
+    go: str = ""
+    # Required module path -> version
+    requires: dict = field(default_factory=dict)
+    # Modules only required indirectly (marked "// indirect")
+    indirect: set = field(default_factory=set)
+    # Replaced module path -> (replacement path, replacement version or "")
+    replaces: dict = field(default_factory=dict)
+
+    @classmethod
+    def FromString(cls, contents):
+        gomod = GoMod()
+        block = None
+        for raw_line in contents.splitlines():
+            line, _, comment = raw_line.partition("//")
+            line = line.strip()
+            if not line:
+                continue
+
+            # Directive blocks, e.g. "require (" ... ")"
+            if line == ")":
+                block = None
+                continue
+            if line.endswith("("):
+                block = line[:-1].strip()
+                continue
+
+            if block:
+                directive, args = block, line.split()
+            else:
+                directive, *args = line.split()
+
+            if directive == "module" and args:
+                gomod.module = args[0].strip('"')
+            elif directive == "go" and args:
+                gomod.go = args[0]
+            elif directive == "require" and len(args) >= 2:
+                gomod.requires[args[0]] = args[1]
+                if comment.strip() == "indirect":
+                    gomod.indirect.add(args[0])
+            elif directive == "replace" and "=>" in args:
+                # <old> [<version>] => <new> [<version>]
+                arrow = args.index("=>")
+                new = args[arrow + 1 :]
+                gomod.replaces[args[0]] = (new[0], new[1] if len(new) > 1 else "")
+
+        return gomod
+
+    # The version of a module a build actually uses, taking replace directives
+    # into account. Local path replacements have no version and are reported
+    # as the path they point to.
+    def effective_version(self, module):
+        if module in self.replaces:
+            new_path, new_version = self.replaces[module]
+            if not new_version:
+                return new_path
+            if new_path != module:
+                return f"{new_path} {new_version}"
+            return new_version
+        return self.requires.get(module)
+
+
+# Turns a Go module version into a key that sorts by semantic version
+# precedence. Pseudo-versions (v0.0.0-20230101000000-abcdef123456,
+# v1.2.4-0.20230101000000-abcdef123456) are ordinary prereleases so sort
+# before the release they precede, and build metadata such as +incompatible
+# is ignored. The leading "v" is optional since OSV omits it. Returns None
+# for anything that isn't a version (e.g. a local replace path).
+def semver_key(version):
+    if version == "0":
+        return MIN_VERSION_KEY
+
+    version = version[1:] if version.startswith("v") else version
+    version = version.partition("+")[0]
+    core, dash, prerelease = version.partition("-")
+    parts = core.split(".")
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+
+    # Releases sort after all of their prereleases; prerelease identifiers
+    # compare numerically if numeric, and numeric ones before alphanumeric.
+    if not dash:
+        pre = (1, ())
+    else:
+        pre = (
+            0,
+            tuple(
+                (0, int(ident)) if ident.isdigit() else (1, ident)
+                for ident in prerelease.split(".")
+            ),
+        )
+
+    major, minor, patch = (int(part) for part in parts)
+    return (major, minor, patch, pre)
+
+
+# Turns a go directive version ("1.16", "1.21.0", "1.22rc1") into a tuple of
+# its numeric components so that it can be compared. A missing directive is
+# treated as go 1.16, as the go command does.
+def go_version_key(version):
+    if not version:
+        return (1, 16)
+
+    key = []
+    for part in version.split("."):
+        digits = ""
+        for char in part:
+            if not char.isdigit():
+                break
+            digits += char
+        if not digits:
+            break
+        key.append(int(digits))
+        if digits != part:
+            break
+    return tuple(key)
+
+
+# Parses a go.sum file into module path -> set of versions it has checksums
+# for (ignoring the separate /go.mod checksums).
+def parse_go_sum(contents):
+    versions = {}
+    for line in contents.splitlines():
+        parts = line.split()
+        if len(parts) != 3:
+            continue
+        module, version, _ = parts
+        if version.endswith("/go.mod"):
+            continue
+        versions.setdefault(module, set()).add(version)
+    return versions
+
+
+# The full set of modules (module path -> version) a branch depends on. go.mod
+# lists every dependency from go 1.17 on; for go.mod files with an older go
+# directive (or none), modules that only appear in go.sum are included at the
+# highest version it has.
+# Replacements are resolved, so a module replaced by a fork is reported under
+# the fork's path, and modules replaced by local directories are dropped.
+def dependency_set(gomod, gosum=None):
+    dependencies = {}
+    for module, version in gomod.requires.items():
+        if module in gomod.replaces:
+            module, replaced_version = gomod.replaces[module]
+            if not replaced_version:
+                continue
+            version = replaced_version
+        dependencies[module] = version
+
+    if go_version_key(gomod.go) >= PRUNED_MODULE_GRAPH_GO_VERSION:
+        gosum = None
+
+    for module, versions in (gosum or {}).items():
+        if module in dependencies or module in gomod.replaces:
+            continue
+        keyed = [(semver_key(v), v) for v in versions]
+        keyed = [(k, v) for k, v in keyed if k is not None]
+        if keyed:
+            dependencies[module] = max(keyed)[1]
+
+    return dict(sorted(dependencies.items()))
+
+
+# Parses a branch's go.mod and go.sum contents; run in a process pool.
+def parse_branch_files(args):
+    gomod_contents, gosum_contents = args
+    gomod = GoMod.FromString(gomod_contents) if gomod_contents is not None else None
+    gosum = parse_go_sum(gosum_contents) if gosum_contents is not None else None
+    return gomod, gosum
+
+
+@dataclass
+class Vulnerability:
+    id: str
+    aliases: list
+    summary: str
+
+    @classmethod
+    def FromOSV(cls, entry):
+        return Vulnerability(
+            id=entry["id"],
+            aliases=entry.get("aliases", []),
+            summary=entry.get("summary") or entry.get("details", "").split("\n")[0],
+        )
+
+    @property
+    def cves(self):
+        ids = [self.id] + self.aliases
+        return [i for i in ids if i.startswith("CVE-")]
+
+
+# An offline snapshot of the OSV / Go vulnerability database (a directory of
+# OSV JSON files, e.g. an unpacked osv-vulnerabilities.storage.googleapis.com
+# Go/all.zip) indexed for lookups by module and version.
+#
+# For each module, the affected ranges of all its vulnerabilities are swept
+# into a sorted list of breakpoints, with the set of vulnerabilities affecting
+# the versions from each breakpoint up to the next one. A lookup is then a
+# dict lookup on the module and a bisect on its breakpoints.
+class VulnIndex(object):
+    def __init__(self):
+        self.vulnerabilities = {}
+        # Module path -> sorted breakpoints
+        self.breakpoints = {}
+        # Module path -> vulnerability IDs affecting each breakpoint's interval
+        self.segments = {}
+        # (module path, vulnerability ID) -> [(semver key, fixed version)]
+        self.fixes = {}
+
+    @classmethod
+    def FromDirectory(cls, path):
+        index = VulnIndex()
+        # Module path -> [(point, +1 / -1, vulnerability ID)]
+        events = {}
+
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                if not filename.endswith(".json"):
+                    continue
+                with open(os.path.join(dirpath, filename), "r") as osv_file:
+                    entry = json.load(osv_file)
+                if "id" not in entry or entry.get("withdrawn"):
+                    continue
+                index.add_entry(entry, events)
+
+        for module, module_events in events.items():
+            index.build_module(module, module_events)
+
+        return index
+
+    # Breakpoints are (semver key, 0) for "from this version on" and
+    # (semver key, 1) for "from just after this version on", so both exclusive
+    # "fixed" and inclusive "last_affected" ends can be represented.
+    def add_entry(self, entry, events):
+        vuln = Vulnerability.FromOSV(entry)
+        self.vulnerabilities[vuln.id] = vuln
+
+        for affected in entry.get("affected", []):
+            package = affected.get("package", {})
+            if package.get("ecosystem") != "Go" or "name" not in package:
+                continue
+            module = package["name"]
+            module_events = events.setdefault(module, [])
+
+            for osv_range in affected.get("ranges", []):
+                if osv_range.get("type") not in OSV_RANGE_TYPES:
+                    continue
+                start = None
+                for event in osv_range.get("events", []):
+                    if "introduced" in event:
+                        start = semver_key(event["introduced"])
+                        if start is not None:
+                            module_events.append(((start, 0), 1, vuln.id))
+                    elif start is not None and "fixed" in event:
+                        end = semver_key(event["fixed"])
+                        if end is None:
+                            continue
+                        module_events.append(((end, 0), -1, vuln.id))
+                        self.fixes.setdefault((module, vuln.id), []).append(
+                            (end, event["fixed"])
+                        )
+                        start = None
+                    elif start is not None and "last_affected" in event:
+                        end = semver_key(event["last_affected"])
+                        if end is None:
+                            continue
+                        module_events.append(((end, 1), -1, vuln.id))
+                        start = None
+
+            for version in affected.get("versions", []):
+                key = semver_key(version)
+                if key is not None:
+                    module_events.append(((key, 0), 1, vuln.id))
+                    module_events.append(((key, 1), -1, vuln.id))
+
+    def build_module(self, module, module_events):
+        active = Counter()
+        breakpoints = []
+        segments = []
+        module_events.sort(key=lambda event: event[0])
+        for point, group in groupby(module_events, key=lambda event: event[0]):
+            for _, delta, vuln_id in group:
+                active[vuln_id] += delta
+                if active[vuln_id] <= 0:
+                    del active[vuln_id]
+            breakpoints.append(point)
+            segments.append(frozenset(active))
+
+        self.breakpoints[module] = breakpoints
+        self.segments[module] = segments
+
+    def lookup(self, module, version):
+        breakpoints = self.breakpoints.get(module)
+        key = semver_key(version)
+        if not breakpoints or key is None:
+            return []
+
+        i = bisect.bisect_right(breakpoints, (key, 0)) - 1
+        if i < 0:
+            return []
+        return [self.vulnerabilities[v] for v in sorted(self.segments[module][i])]
+
+    # The lowest version fixing the vulnerability that is newer than the given
+    # version, if there is one.
+    def fixed_version(self, module, vuln_id, version):
+        key = semver_key(version)
+        fixes = [fix for fix in self.fixes.get((module, vuln_id), []) if key < fix[0]]
+        return min(fixes)[1] if fixes else None
+
+
 class Module(object):
     def __init__(self, repo, raw_path):
         self.repo = repo
@@ -76,7 +412,58 @@ class Repo(object):
 
     def change_branch(self, branch):
         os.chdir(self.path)
-        subprocess.run(["git", "checkout", release_branch.branch_name], check=True)
+        subprocess.run(["git", "checkout", branch.branch_name], check=True)
+
+    # Reads files as they are on each of the given branches straight from the
+    # object store, without checking anything out. All of the objects are
+    # fetched by a single `git cat-file --batch` process. Returns
+    # {(branch, path): contents}, with None for files missing on a branch.
+    def read_files_at_branches(self, branches, paths, remote="origin"):
+        specs = [
+            (branch, path, f"{remote}/{branch.branch_name}:{path}")
+            for branch in branches
+            for path in paths
+        ]
+        cmd = subprocess.run(
+            ["git", "cat-file", "--batch"],
+            cwd=self.path,
+            input="".join(f"{spec}\n" for _, _, spec in specs).encode("utf-8"),
+            capture_output=True,
+            check=True,
+        )
+
+        # Each object is "<sha> <type> <size>\n<contents>\n", or
+        # "<spec> missing\n" if it doesn't exist.
+        files = {}
+        output = cmd.stdout
+        offset = 0
+        for branch, path, spec in specs:
+            newline = output.index(b"\n", offset)
+            header = output[offset:newline].decode("utf-8").split()
+            offset = newline + 1
+            if header[-1] == "missing" or header[1] != "blob":
+                files[(branch, path)] = None
+                if header[-1] != "missing":
+                    offset += int(header[2]) + 1
+                continue
+
+            size = int(header[2])
+            files[(branch, path)] = output[offset : offset + size].decode("utf-8")
+            offset += size + 1
+
+        return files
+
+    # Parses go.mod and go.sum for every branch (in parallel) and returns
+    # {branch: (GoMod, go.sum versions)}; either may be None if the file
+    # doesn't exist on that branch.
+    def read_go_modules(self, branches, remote="origin"):
+        files = self.read_files_at_branches(branches, ["go.mod", "go.sum"], remote)
+        with ProcessPoolExecutor() as executor:
+            parsed = executor.map(
+                parse_branch_files,
+                [(files[(b, "go.mod")], files[(b, "go.sum")]) for b in branches],
+            )
+            return dict(zip(branches, parsed))
 
     def find_all_main_modules(self):
         args = [
@@ -113,11 +500,13 @@ class Repo(object):
 
         return [Module(self, module) for module in deduped]
 
-    def get_all_release_branches(self):
+    # Only branches on the given remote are listed, since that is where
+    # read_files_at_branches() reads them from.
+    def get_all_release_branches(self, remote="origin"):
         os.chdir(self.path)
 
         cmd = subprocess.run(
-            ["git", "branch", "--remote"],
+            ["git", "branch", "--remote", "--list", f"{remote}/release-4.*"],
             capture_output=True,
             text=True,
             check=True,
@@ -125,9 +514,9 @@ class Repo(object):
 
         filtered_items = set(
             (
-                ReleaseBranch.FromString(item.strip().split("/")[1])
+                ReleaseBranch.FromString(item.strip().removeprefix(f"{remote}/"))
                 for item in cmd.stdout.split("\n")
-                if "/release-4" in item
+                if item.strip()
             )
         )
 
@@ -148,46 +537,216 @@ class Repo(object):
             ]
 
 
-repo_dir = "/home/zzlotnik/Scratchspace/claude-mco-workspace"
+# Builds a module x branch version matrix: {module: {branch: version}}, for
+# every module required on any branch (or just those whose path contains one
+# of the given substrings).
+def version_matrix(go_modules, module_filters=None):
+    matrix = {}
+    for branch, (gomod, _) in go_modules.items():
+        if gomod is None:
+            continue
+        for module in gomod.requires:
+            if module_filters and not any(f in module for f in module_filters):
+                continue
+            matrix.setdefault(module, {})[branch] = gomod.effective_version(module)
+    return dict(sorted(matrix.items()))
+
+
+# Cross-references each branch's full dependency set against the vulnerability
+# index, returning {branch: [row]} with one row per affected module and
+# vulnerability.
+def cve_table(go_modules, vuln_index):
+    table = {}
+    for branch, (gomod, gosum) in go_modules.items():
+        rows = table.setdefault(branch, [])
+        if gomod is None:
+            continue
+        for module, version in dependency_set(gomod, gosum).items():
+            for vuln in vuln_index.lookup(module, version):
+                rows.append(
+                    {
+                        "module": module,
+                        "version": version,
+                        "id": vuln.id,
+                        "cves": vuln.cves,
+                        "fixed": vuln_index.fixed_version(module, vuln.id, version),
+                        "summary": vuln.summary,
+                    }
+                )
+    return table
+
+
+def write_cve_table(table, output, output_format="table"):
+    if output_format == "json":
+        json.dump({str(b): rows for b, rows in table.items()}, output, indent=2)
+        output.write("\n")
+        return
+
+    rows = [["branch", "module", "version", "id", "cves", "fixed", "summary"]]
+    for branch, branch_rows in table.items():
+        for row in branch_rows:
+            rows.append(
+                [
+                    str(branch),
+                    row["module"],
+                    row["version"],
+                    row["id"],
+                    ",".join(row["cves"]) or "-",
+                    row["fixed"] or "-",
+                    row["summary"],
+                ]
+            )
+    write_rows(rows, output, output_format)
 
-repo = Repo(repo_dir)
 
-for release_branch in repo.get_all_release_branches():
-    if release_branch.minor <= 10:
-        continue
-    repo.change_branch(release_branch)
-    print(release_branch)
+def write_rows(rows, output, output_format):
+    if output_format == "csv":
+        csv.writer(output).writerows(rows)
+        return
 
-    gomodfilepath = os.path.join(repo.path, "go.mod")
-    with open(gomodfilepath, "r") as gomodfile:
-        for line in gomodfile:
-            if "logrus" in line:
-                print(release_branch, line)
-                break
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        output.write("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+        output.write("\n")
 
-#    os.chdir(repo.path)
 
-#    started_builds = {}
+def write_version_matrix(matrix, branches, output, output_format="table"):
+    if output_format == "json":
+        json.dump(
+            {
+                module: {str(b): v for b, v in versions.items()}
+                for module, versions in matrix.items()
+            },
+            output,
+            indent=2,
+        )
+        output.write("\n")
+        return
+
+    rows = [["module"] + [str(b) for b in branches]]
+    for module, versions in matrix.items():
+        rows.append([module] + [versions.get(b) or "-" for b in branches])
+    write_rows(rows, output, output_format)
+
+
+# The original approach: check out each branch in turn and grep its go.mod.
+def inspect_by_checkout(repo, branches, needle):
+    for release_branch in branches:
+        repo.change_branch(release_branch)
+        print(release_branch)
+
+        gomodfilepath = os.path.join(repo.path, "go.mod")
+        with open(gomodfilepath, "r") as gomodfile:
+            for line in gomodfile:
+                if needle in line:
+                    print(release_branch, line)
+                    break
+
+    #    os.chdir(repo.path)
+
+    #    started_builds = {}
+
+    #    for module in repo.find_all_main_modules():
+    #        os.makedirs(repo.debug_build_dir_for_branch(release_branch), exist_ok=True)
+    #        os.chdir(module.full_path_on_disk)
+    #
+    #        build_args = module.podman_build_command(release_branch)
+    #        print(build_args)
+    #        print(subprocess.list2cmdline(build_args))
+    #        started_builds[module.name] = subprocess.Popen(build_args)
+    #
+    #    finished_builds = set()
+    #
+    #    while True:
+    #        for name, started_build in started_builds.items():
+    #            if started_build.poll() != None and name not in finished_builds:
+    #                print(f"{release_branch} - {name} finished")
+    #                finished_builds.add(name)
+    #
+    #        if finished_builds == set(started_builds.keys()):
+    #            print(f"All builds for {release_branch} done")
+    #            break
+    #
+    #        time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect the Go dependencies of each MCO release branch."
+    )
+    parser.add_argument("--repo", default=DEFAULT_REPO_DIR, help="MCO checkout")
+    parser.add_argument(
+        "--mode",
+        choices=["matrix", "cves", "checkout"],
+        default="matrix",
+        help="matrix reads go.mod/go.sum from the object store without touching "
+        "the working tree; cves does the same and looks up every dependency in "
+        "--vuln-db; checkout checks out each branch and greps go.mod",
+    )
+    parser.add_argument(
+        "--vuln-db",
+        help="Directory of OSV JSON files (an offline Go vulnerability database "
+        "snapshot), required by --mode cves",
+    )
+    parser.add_argument(
+        "--min-minor",
+        type=int,
+        default=DEFAULT_MIN_MINOR,
+        help=f"Skip release-4.N branches with N <= this (default {DEFAULT_MIN_MINOR})",
+    )
+    parser.add_argument(
+        "--remote",
+        default="origin",
+        help="Remote whose release branches are inspected (default origin)",
+    )
+    parser.add_argument(
+        "--module",
+        dest="modules",
+        action="append",
+        default=[],
+        help="Only show modules whose path contains this; repeatable "
+        "(checkout mode greps for the first, default logrus)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["table", "csv", "json"],
+        default="table",
+        help="Output format of the version matrix or CVE table",
+    )
+    args = parser.parse_args()
+    if args.mode == "cves" and not args.vuln_db:
+        parser.error("--mode cves requires --vuln-db")
+
+    repo = Repo(args.repo)
+    branches = [
+        branch
+        for branch in repo.get_all_release_branches(args.remote)
+        if branch.minor > args.min_minor
+    ]
+
+    if args.mode == "checkout":
+        inspect_by_checkout(repo, branches, (args.modules or ["logrus"])[0])
+        return
+
+    go_modules = repo.read_go_modules(branches, args.remote)
+    if args.mode == "cves":
+        vuln_index = VulnIndex.FromDirectory(args.vuln_db)
+        write_cve_table(cve_table(go_modules, vuln_index), sys.stdout, args.format)
+    else:
+        matrix = version_matrix(go_modules, args.modules)
+        write_version_matrix(matrix, branches, sys.stdout, args.format)
+
+    # A branch without a go.mod can't be checked, which mustn't look the same
+    # as a branch without any vulnerable dependencies.
+    missing = [branch for branch, (gomod, _) in go_modules.items() if gomod is None]
+    for branch in missing:
+        print(
+            f"error: {args.remote}/{branch.branch_name}: go.mod not found",
+            file=sys.stderr,
+        )
+    if missing:
+        sys.exit(1)
 
-#    for module in repo.find_all_main_modules():
-#        os.makedirs(repo.debug_build_dir_for_branch(release_branch), exist_ok=True)
-#        os.chdir(module.full_path_on_disk)
-#
-#        build_args = module.podman_build_command(release_branch)
-#        print(build_args)
-#        print(subprocess.list2cmdline(build_args))
-#        started_builds[module.name] = subprocess.Popen(build_args)
-#
-#    finished_builds = set()
-#
-#    while True:
-#        for name, started_build in started_builds.items():
-#            if started_build.poll() != None and name not in finished_builds:
-#                print(f"{release_branch} - {name} finished")
-#                finished_builds.add(name)
-#
-#        if finished_builds == set(started_builds.keys()):
-#            print(f"All builds for {release_branch} done")
-#            break
-#
-#        time.sleep(1)
+
+if __name__ == "__main__":
+    main()